@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Small result-caching query frontend for Prometheus.
+
+Grafana tabs showing the same dashboard re-run identical queries on every refresh.
+This proxy sits between Grafana and Prometheus, aligns query_range/query requests to
+the step and the cache TTL so concurrent viewers produce the same cache key, and
+serves repeats from memory. Identical in-flight requests are coalesced so only one
+reaches Prometheus. Everything else (labels, series, metadata) is passed through.
+
+Usage:
+    query_cache.py serve                 # run the proxy (configured via env, see below)
+    query_cache.py bench [--viewers N]   # simulate concurrent viewers against a stub backend
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configuration
+UPSTREAM_URL = os.environ.get("QUERY_CACHE_UPSTREAM", "http://prometheus:9090")
+LISTEN_PORT = int(os.environ.get("QUERY_CACHE_PORT", "9091"))
+# Keep in sync with the dashboard refresh interval (DASHBOARD_REFRESH in update_dashboard.py)
+CACHE_TTL = os.environ.get("QUERY_CACHE_TTL", "30s")
+MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "5000"))
+OVERVIEW_DASHBOARD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboards", "stack-overview.json")
+
+CACHED_PATHS = ("/api/v1/query", "/api/v1/query_range")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+
+def parse_duration(value):
+    """Parse a Prometheus duration ("30s", "1m30s") or a float number of seconds"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h|d|w|y)', value or "")
+    if not parts or "".join(n + u for n, u in parts) != value:
+        raise ValueError(f"invalid duration: {value!r}")
+    return sum(float(n) * DURATION_UNITS[u] for n, u in parts)
+
+def format_timestamp(value):
+    """Format an aligned timestamp without losing precision ("1792405740", or "1792405740.5")"""
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+def align_params(path, params, ttl, now):
+    """
+    Align request params so equivalent requests from different viewers share a cache key.
+    query_range: end is floored to the TTL bucket, start keeps the same range length, and
+    both are floored to a multiple of step. query: time is floored to the TTL bucket.
+    Returns the aligned params, or None if the request can't be cached.
+    """
+    params = dict(params)
+    try:
+        if path == "/api/v1/query_range":
+            step = parse_duration(params["step"])
+            start = float(params["start"])
+            end = float(params["end"])
+            if step <= 0:
+                return None
+
+            aligned_end = math.floor(end / ttl) * ttl
+            aligned_start = start - (end - aligned_end)
+            params["start"] = format_timestamp(math.floor(aligned_start / step) * step)
+            params["end"] = format_timestamp(math.floor(aligned_end / step) * step)
+        else:
+            instant = float(params.get("time", now))
+            params["time"] = format_timestamp(math.floor(instant / ttl) * ttl)
+    except (KeyError, ValueError):
+        return None
+
+    return params
+
+class QueryCache:
+    """In-memory TTL cache with request coalescing"""
+
+    def __init__(self, upstream, ttl, max_entries=MAX_ENTRIES, clock=time.time):
+        self.upstream = upstream.rstrip("/")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = {}
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "passthrough": 0}
+
+    def fetch(self, path, params):
+        """POST form params upstream, returning (status, content_type, body)"""
+        data = urllib.parse.urlencode(params).encode()
+        request = urllib.request.Request(f"{self.upstream}{path}", data=data, method="POST")
+        request.add_header("Content-Type", "application/x-www-form-urlencoded")
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, response.headers.get("Content-Type", "application/json"), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("Content-Type", "application/json"), e.read()
+
+    def query(self, path, params):
+        """Serve a query/query_range request, returns (status, content_type, body, cache_status)"""
+        now = self.clock()
+        aligned = align_params(path, params, self.ttl, now)
+        if aligned is None:
+            with self.lock:
+                self.stats["passthrough"] += 1
+            return self.fetch(path, params) + ("BYPASS",)
+
+        key = (path, tuple(sorted(aligned.items())))
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.stats["hits"] += 1
+                return entry[1:] + ("HIT",)
+
+            waiter = self.inflight.get(key)
+            if waiter is None:
+                waiter = self.inflight[key] = threading.Event()
+                leader = True
+                self.stats["misses"] += 1
+            else:
+                leader = False
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            waiter.wait()
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry:
+                return entry[1:] + ("HIT",)
+            # Leader got an error response, which isn't cached
+            return self.fetch(path, aligned) + ("MISS",)
+
+        try:
+            result = self.fetch(path, aligned)
+            if result[0] == 200:
+                with self.lock:
+                    if len(self.entries) >= self.max_entries:
+                        self.evict(now)
+                    self.entries[key] = (now + self.ttl,) + result
+            return result + ("MISS",)
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            waiter.set()
+
+    def evict(self, now):
+        """Drop expired entries, and the oldest ones if still full (caller holds the lock)"""
+        for key in [k for k, v in self.entries.items() if v[0] <= now]:
+            del self.entries[key]
+        while len(self.entries) >= self.max_entries:
+            del self.entries[next(iter(self.entries))]
+
+def upstream_error(error):
+    """Body for a 502 response to an upstream failure"""
+    reason = getattr(error, "reason", None) or error
+    return f"upstream error: {reason}".encode()
+
+def make_handler(cache):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def read_params(self):
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                params.update(urllib.parse.parse_qsl(body.decode()))
+            return url.path, params, body
+
+        def respond(self, status, content_type, body, cache_status=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if cache_status:
+                self.send_header("X-Cache", cache_status)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def passthrough(self, path, body):
+            url = urllib.parse.urlsplit(self.path)
+            target = f"{cache.upstream}{path}" + (f"?{url.query}" if url.query else "")
+            request = urllib.request.Request(target, data=body or None, method=self.command)
+            if self.headers.get("Content-Type"):
+                request.add_header("Content-Type", self.headers["Content-Type"])
+            with cache.lock:
+                cache.stats["passthrough"] += 1
+            try:
+                with urllib.request.urlopen(request, timeout=120) as response:
+                    self.respond(response.status, response.headers.get("Content-Type", "application/json"), response.read())
+            except urllib.error.HTTPError as e:
+                self.respond(e.code, e.headers.get("Content-Type", "application/json"), e.read())
+            except OSError as e:
+                self.respond(502, "text/plain", upstream_error(e))
+
+        def handle_request(self):
+            path, params, body = self.read_params()
+
+            if path == "/-/cache-stats":
+                with cache.lock:
+                    stats = dict(cache.stats, entries=len(cache.entries))
+                return self.respond(200, "application/json", json.dumps(stats).encode())
+
+            if path not in CACHED_PATHS:
+                return self.passthrough(path, body)
+
+            try:
+                self.respond(*cache.query(path, params))
+            except OSError as e:
+                # URLError for connection failures, plain OSError (timeouts, resets) once connected
+                self.respond(502, "text/plain", upstream_error(e))
+
+        do_GET = handle_request
+        do_POST = handle_request
+
+    return Handler
+
+def start_server(handler, port=0):
+    """Start a threaded HTTP server in the background, returns the server"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def serve():
+    ttl = parse_duration(CACHE_TTL)
+    cache = QueryCache(UPSTREAM_URL, ttl)
+    server = ThreadingHTTPServer(("0.0.0.0", LISTEN_PORT), make_handler(cache))
+    server.daemon_threads = True
+    print(f"✓ Caching {', '.join(CACHED_PATHS)} from {UPSTREAM_URL} for {ttl:g}s on :{LISTEN_PORT}")
+    server.serve_forever()
+
+def load_dashboard_queries(dashboard_path):
+    """Extract the Prometheus target expressions from a generated dashboard"""
+    with open(dashboard_path, 'r') as f:
+        dashboard = json.load(f)
+
+    queries = []
+    for panel in dashboard.get('panels', []):
+        panel_ds = (panel.get('datasource') or {}).get('type')
+        for target in panel.get('targets', []):
+            ds = (target.get('datasource') or {}).get('type', panel_ds)
+            if ds == 'prometheus' and target.get('expr'):
+                queries.append(target['expr'])
+    return queries
+
+def make_stub_backend(latency, status=200):
+    """Stub Prometheus that counts requests and answers with an empty matrix (or an error for status != 200)"""
+    counter = {"requests": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle_request(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            with lock:
+                counter["requests"] += 1
+            time.sleep(latency)
+            if status == 200:
+                body = b'{"status":"success","data":{"resultType":"matrix","result":[]}}'
+            else:
+                body = b'{"status":"error","errorType":"execution","error":"stub error"}'
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = handle_request
+        do_POST = handle_request
+
+    return Handler, counter
+
+def simulate_viewers(base_url, queries, viewers, cycles, refresh, step):
+    """
+    Simulate dashboard viewers: each opens at a random offset within the first refresh interval,
+    then re-runs every query once per refresh. Returns the number of client requests made.
+    """
+    def viewer(offset):
+        time.sleep(offset)
+        sent = 0
+        for cycle in range(cycles):
+            cycle_start = time.time()
+            end = cycle_start
+            for expr in queries:
+                data = urllib.parse.urlencode({"query": expr, "start": end - 6 * 3600, "end": end, "step": step}).encode()
+                urllib.request.urlopen(urllib.request.Request(f"{base_url}/api/v1/query_range", data=data), timeout=30).read()
+                sent += 1
+            time.sleep(max(0, refresh - (time.time() - cycle_start)))
+        return sent
+
+    with ThreadPoolExecutor(max_workers=viewers) as pool:
+        offsets = [random.uniform(0, refresh) for _ in range(viewers)]
+        return sum(pool.map(viewer, offsets))
+
+def bench(args):
+    """Compare backend query load with and without the cache under simulated concurrent viewers"""
+    queries = load_dashboard_queries(args.dashboard)
+    if not queries:
+        print(f"No Prometheus queries found in {args.dashboard}")
+        return 1
+
+    print(f"Simulating {args.viewers} viewers × {args.cycles} refreshes of {len(queries)} queries "
+          f"(refresh {args.refresh:g}s, step {args.step:g}s, backend latency {args.latency * 1000:g}ms)\n")
+
+    results = {}
+    for mode in ("direct", "cached"):
+        handler, counter = make_stub_backend(args.latency)
+        backend = start_server(handler)
+        upstream = f"http://127.0.0.1:{backend.server_address[1]}"
+        proxy = None
+
+        if mode == "cached":
+            # TTL aligned to the refresh interval, as in production
+            proxy = start_server(make_handler(QueryCache(upstream, args.refresh)))
+            target = f"http://127.0.0.1:{proxy.server_address[1]}"
+        else:
+            target = upstream
+
+        start = time.perf_counter()
+        sent = simulate_viewers(target, queries, args.viewers, args.cycles, args.refresh, args.step)
+        elapsed = time.perf_counter() - start
+        results[mode] = (sent, counter["requests"], elapsed)
+
+        for server in (proxy, backend):
+            if server:
+                server.shutdown()
+                server.server_close()
+
+    print(f"{'mode':<8} {'client requests':>16} {'backend queries':>16} {'wall time':>10}")
+    for mode, (sent, backend_requests, elapsed) in results.items():
+        print(f"{mode:<8} {sent:>16} {backend_requests:>16} {elapsed:>9.1f}s")
+
+    direct, cached = results["direct"][1], results["cached"][1]
+    reduction = (1 - cached / direct) * 100 if direct else 0
+    print(f"\n✓ Backend query load reduced by {reduction:.0f}% ({direct} → {cached})")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Result-caching query frontend for Prometheus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("serve", help="Run the caching proxy")
+    bench_parser = subparsers.add_parser("bench", help="Benchmark backend load with and without the cache")
+    bench_parser.add_argument("--dashboard", default=OVERVIEW_DASHBOARD, help="Dashboard whose queries are replayed")
+    bench_parser.add_argument("--viewers", type=int, default=8)
+    bench_parser.add_argument("--cycles", type=int, default=3, help="Refreshes per viewer")
+    bench_parser.add_argument("--refresh", type=float, default=1.0, help="Refresh interval in seconds (compressed from 30s)")
+    bench_parser.add_argument("--step", type=float, default=60.0, help="query_range step in seconds")
+    bench_parser.add_argument("--latency", type=float, default=0.005, help="Stub backend latency per query in seconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        return bench(args)
+
+    serve()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# update_dashboard.py lives at the repo root, query_cache.py beside the monitoring stack
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "stacks", "monitoring", "query-cache"))
@@ -0,0 +1,173 @@
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from query_cache import QueryCache, align_params, format_timestamp, make_handler, make_stub_backend, start_server
+
+# A realistic epoch, well past the 6 significant digits :g would keep
+END = 1792405759
+
+
+def test_query_range_aligned_to_ttl_and_step():
+    params = {"query": "up", "start": str(END - 6 * 3600), "end": str(END), "step": "15"}
+
+    aligned = align_params("/api/v1/query_range", params, ttl=30, now=END)
+
+    assert aligned["end"] == "1792405740"
+    # Range length is kept: start moves back by the same 19s as end
+    assert aligned["start"] == "1792384140"
+    assert aligned["step"] == "15"
+    assert aligned["query"] == "up"
+
+
+def test_query_range_same_key_within_ttl_bucket():
+    def aligned(end):
+        params = {"query": "up", "start": str(end - 3600), "end": str(end), "step": "15s"}
+        return align_params("/api/v1/query_range", params, ttl=30, now=end)
+
+    assert aligned(END) == aligned(END - 10)
+    assert aligned(END) != aligned(END + 30)
+
+
+def test_query_range_fractional_step_keeps_precision():
+    params = {"query": "up", "start": str(END + 0.75 - 3600.25), "end": str(END + 0.75), "step": "0.5"}
+
+    aligned = align_params("/api/v1/query_range", params, ttl=1, now=END)
+
+    assert aligned["end"] == "1792405759"
+    assert aligned["start"] == "1792402158.5"
+
+
+def test_instant_query_time_aligned_to_ttl():
+    assert align_params("/api/v1/query", {"query": "up", "time": f"{END}.123"}, ttl=30, now=0)["time"] == "1792405740"
+    # Without time, "now" is used
+    assert align_params("/api/v1/query", {"query": "up"}, ttl=30, now=END)["time"] == "1792405740"
+
+
+def test_uncacheable_requests():
+    assert align_params("/api/v1/query_range", {"query": "up"}, ttl=30, now=END) is None
+    assert align_params("/api/v1/query_range", {"query": "up", "start": "1", "end": "2", "step": "0"}, ttl=30, now=END) is None
+
+
+def test_format_timestamp():
+    assert format_timestamp(1792405740.0) == "1792405740"
+    assert format_timestamp(1792405740.5) == "1792405740.5"
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def backend():
+    """Start a stub Prometheus, returns a function (latency, status) -> (url, counter)"""
+    servers = []
+
+    def start(latency=0, status=200):
+        handler, counter = make_stub_backend(latency, status)
+        server = start_server(handler)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", counter
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def range_params(end=END):
+    return {"query": "up", "start": str(end - 3600), "end": str(end), "step": "15"}
+
+
+def test_cache_hit_skips_upstream(backend):
+    url, counter = backend()
+    cache = QueryCache(url, ttl=30, clock=Clock(END))
+
+    first = cache.query("/api/v1/query_range", range_params())
+    second = cache.query("/api/v1/query_range", range_params(END - 5))
+
+    assert first[0] == 200 and first[3] == "MISS"
+    assert second == first[:3] + ("HIT",)
+    assert counter["requests"] == 1
+
+
+def test_cache_entry_expires_after_ttl(backend):
+    url, counter = backend()
+    clock = Clock(END)
+    cache = QueryCache(url, ttl=30, clock=clock)
+
+    cache.query("/api/v1/query_range", range_params())
+    clock.now += 30
+
+    assert cache.query("/api/v1/query_range", range_params())[3] == "MISS"
+    assert counter["requests"] == 2
+
+
+def test_concurrent_identical_requests_coalesced(backend):
+    url, counter = backend(latency=0.2)
+    cache = QueryCache(url, ttl=30, clock=Clock(END))
+    viewers = 8
+    barrier = threading.Barrier(viewers)
+    results = []
+
+    def viewer():
+        barrier.wait()
+        results.append(cache.query("/api/v1/query_range", range_params()))
+
+    threads = [threading.Thread(target=viewer) for _ in range(viewers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter["requests"] == 1
+    assert cache.stats["misses"] == 1
+    assert cache.stats["coalesced"] == viewers - 1
+    assert {result[:3] for result in results} == {results[0][:3]}
+
+
+def test_error_response_not_cached(backend):
+    url, counter = backend(status=422)
+    cache = QueryCache(url, ttl=30, clock=Clock(END))
+
+    first = cache.query("/api/v1/query_range", range_params())
+    second = cache.query("/api/v1/query_range", range_params())
+
+    assert first[0] == second[0] == 422
+    assert second[3] == "MISS"
+    assert counter["requests"] == 2
+    assert cache.entries == {}
+
+
+def test_upstream_disconnect_returns_502():
+    class Disconnect(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            # Close the connection without a response, the client sees a reset rather than a URLError
+            self.close_connection = True
+
+        do_GET = do_POST
+
+    upstream = start_server(Disconnect)
+    cache = QueryCache(f"http://127.0.0.1:{upstream.server_address[1]}", ttl=30)
+    proxy = start_server(make_handler(cache))
+    base = f"http://127.0.0.1:{proxy.server_address[1]}"
+    try:
+        for path in ("/api/v1/query?query=up", "/api/v1/labels"):
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(f"{base}{path}", timeout=5)
+            assert error.value.code == 502
+            assert error.value.read().startswith(b"upstream error:")
+    finally:
+        for server in (proxy, upstream):
+            server.shutdown()
+            server.server_close()
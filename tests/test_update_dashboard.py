@@ -0,0 +1,496 @@
+import argparse
+import asyncio
+import copy
+import json
+import urllib.parse
+
+import pytest
+
+import update_dashboard
+
+
+DASHBOARD = {
+    "uid": "stackr-test",
+    "title": "Stackr: Test",
+    "refresh": "30s",
+    "panels": [
+        {"type": "row", "title": "web", "id": 1},
+        {
+            "title": "CPU",
+            "type": "timeseries",
+            "id": 2,
+            "datasource": {"type": "prometheus", "uid": "prometheus"},
+            "targets": [
+                {"expr": 'sum(rate(container_cpu_usage_seconds_total{name="web"}[$__rate_interval]))', "refId": "A"}
+            ]
+        },
+        {
+            "title": "Errors",
+            "type": "stat",
+            "id": 3,
+            "datasource": {"type": "loki", "uid": "loki"},
+            "targets": [
+                {"expr": 'sum(count_over_time({container="web"} [$__range])) or vector(0)', "refId": "A"}
+            ]
+        },
+        {
+            "title": "Mean CPU",
+            "type": "timeseries",
+            "id": 4,
+            "datasource": {"type": "prometheus", "uid": "prometheus"},
+            "targets": [
+                {"expr": 'last_over_time(stackr:stack_cpu_percent:avg_1d{stack="web"}[1d])', "refId": "A", "interval": "1d"}
+            ]
+        }
+    ]
+}
+
+URLS = {"prometheus": "http://prom:9090", "loki": "http://loki:3100"}
+
+
+def loadtest_args(**overrides):
+    args = dict(
+        viewers=2, cycles=1, refresh=None, range="6h", max_concurrent=6, timeout=30,
+        prometheus_url=update_dashboard.PROMETHEUS_URL, loki_url=update_dashboard.LOKI_URL,
+        through_cache=False, query_cache_url=update_dashboard.QUERY_CACHE_URL, stub=True, stub_latency=0.001
+    )
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def test_expand_macros():
+    expr = "rate(x[$__rate_interval]) $__interval $__interval_ms [$__range] $__range_s $__range_ms"
+
+    expanded = update_dashboard.expand_macros(expr, 6 * 3600, 30)
+
+    # $__rate_interval = max($__interval + scrape interval, 4 * scrape interval)
+    assert expanded == "rate(x[1m]) 30s 30000 [6h] 21600 21600000"
+
+
+def test_query_interval():
+    # 6h over ~1000 points rounds up to 30s, never below the min interval
+    assert update_dashboard.query_interval(6 * 3600, 15) == 30
+    assert update_dashboard.query_interval(300, 15) == 15
+    assert update_dashboard.query_interval(6 * 3600, 86400) == 86400
+
+
+def test_extract_loadtest_queries():
+    panels = update_dashboard.extract_loadtest_queries(DASHBOARD, 6 * 3600, URLS)
+
+    assert panels == [
+        ("web / CPU", [(
+            "http://prom:9090/api/v1/query_range",
+            {"query": 'sum(rate(container_cpu_usage_seconds_total{name="web"}[1m]))', "step": 30}
+        )]),
+        ("web / Errors", [(
+            "http://loki:3100/loki/api/v1/query_range",
+            {"query": 'sum(count_over_time({container="web"} [6h])) or vector(0)', "step": 30}
+        )]),
+        # The target's own interval raises the step
+        ("web / Mean CPU", [(
+            "http://prom:9090/api/v1/query_range",
+            {"query": 'last_over_time(stackr:stack_cpu_percent:avg_1d{stack="web"}[1d])', "step": 86400}
+        )])
+    ]
+
+
+def test_run_viewer_against_stub_scales_loki_timestamps():
+    async def run():
+        received = []
+        stub = await update_dashboard.start_stub_backend(0, received)
+        url = f"http://127.0.0.1:{stub.sockets[0].getsockname()[1]}"
+        panels = update_dashboard.extract_loadtest_queries(DASHBOARD, 3600, {"prometheus": url, "loki": url})
+        samples = {"panels": {}, "errors": {}, "dashboard": []}
+        try:
+            await update_dashboard.run_viewer(panels, 3600, 30, 1, 0, 6, 30, samples)
+        finally:
+            stub.close()
+            await stub.wait_closed()
+        return received, samples
+
+    received, samples = asyncio.run(run())
+
+    params = {}
+    for line in received:
+        method, target, _ = line.split(" ")
+        parts = urllib.parse.urlsplit(target)
+        params[parts.path] = params.get(parts.path, []) + [dict(urllib.parse.parse_qsl(parts.query))]
+
+    assert len(params["/api/v1/query_range"]) == 2
+    (loki,) = params["/loki/api/v1/query_range"]
+    prom = params["/api/v1/query_range"][0]
+
+    # Prometheus gets seconds, Loki the same window in nanoseconds
+    assert int(prom["end"]) - int(prom["start"]) == 3600
+    assert int(loki["start"]) == int(prom["start"]) * 10**9
+    assert int(loki["end"]) == int(prom["end"]) * 10**9
+
+    assert sorted(samples["panels"]) == ["web / CPU", "web / Errors", "web / Mean CPU"]
+    assert all(count == 0 for count in samples["errors"].values())
+    assert len(samples["dashboard"]) == 1
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert update_dashboard.percentile(values, 50) == 50
+    assert update_dashboard.percentile(values, 99) == 99
+    assert update_dashboard.percentile([7], 99) == 7
+
+
+def test_loadtest_report(tmp_path, monkeypatch, capsys):
+    (tmp_path / "stack-test.json").write_text(json.dumps(DASHBOARD))
+    monkeypatch.setattr(update_dashboard, "DASHBOARD_OUTPUT_DIR", str(tmp_path))
+
+    assert update_dashboard.loadtest("stackr-test", loadtest_args()) == 0
+
+    lines = capsys.readouterr().out.splitlines()
+    header = next(i for i, line in enumerate(lines) if line.startswith("panel"))
+    assert lines[header].split() == ["panel", "p50", "ms", "p99", "ms", "errors"]
+
+    rows = {}
+    for line in lines[header + 1:]:
+        label, p50, p99, errors = line.rsplit(None, 3)
+        rows[label.strip()] = (float(p50), float(p99), int(errors))
+
+    assert set(rows) == {"web / CPU", "web / Errors", "web / Mean CPU", "total (dashboard load)"}
+    for p50, p99, errors in rows.values():
+        assert 0 <= p50 <= p99
+        assert errors == 0
+
+
+def test_loadtest_counts_timeouts_as_errors(tmp_path, monkeypatch, capsys):
+    (tmp_path / "stack-test.json").write_text(json.dumps(DASHBOARD))
+    monkeypatch.setattr(update_dashboard, "DASHBOARD_OUTPUT_DIR", str(tmp_path))
+
+    assert update_dashboard.loadtest("stackr-test", loadtest_args(viewers=1, stub_latency=1, timeout=0.05)) == 1
+
+    total = next(line for line in capsys.readouterr().out.splitlines() if line.startswith("total"))
+    assert total.split()[-1] == "3"
+
+
+def test_loadtest_unknown_uid(tmp_path, monkeypatch):
+    monkeypatch.setattr(update_dashboard, "DASHBOARD_OUTPUT_DIR", str(tmp_path))
+    assert update_dashboard.loadtest("nope", loadtest_args()) == 1
+
+
+def test_normalize_image():
+    assert update_dashboard.normalize_image("ghcr.io/app:${TAG}") == "ghcr.io/app"
+    assert update_dashboard.normalize_image("ghcr.io/app:${VERSION:-release}") == "ghcr.io/app:release"
+    assert update_dashboard.normalize_image("ghcr.io/app:${VERSION-release}") == "ghcr.io/app:release"
+    assert update_dashboard.normalize_image("$IMAGE") is None
+    assert update_dashboard.normalize_image("postgres:16-alpine") == "postgres:16-alpine"
+
+
+def test_read_compose_skips_comments_for_containers_and_services(tmp_path):
+    compose = tmp_path / "docker-compose.yml"
+    compose.write_text(
+        "name: shop\n"
+        "services:\n"
+        "  web:\n"
+        "    image: ghcr.io/shop/web:${TAG}\n"
+        "    container_name: shop_web\n"
+        "  # old:\n"
+        "  #   container_name: shop_old\n"
+        "  worker:\n"
+        "    image: redis:6 # pinned\n"
+        "networks:\n"
+        "  default:\n"
+    )
+
+    compose_data = update_dashboard.read_compose(compose, "store")
+
+    assert compose_data == {
+        "project": "shop",
+        "containers": ["shop_web"],
+        "services": [
+            {"service": "web", "container_name": "shop_web", "image": "ghcr.io/shop/web", "restart": None, "profiles": []},
+            {"service": "worker", "container_name": None, "image": "redis:6", "restart": None, "profiles": []}
+        ]
+    }
+    assert update_dashboard.read_compose(tmp_path / "missing.yml", "store") is None
+
+
+def test_read_compose_restart_and_profiles(tmp_path):
+    compose = tmp_path / "docker-compose.yml"
+    compose.write_text(
+        "services:\n"
+        "  app:\n"
+        "    restart: unless-stopped\n"
+        "    deploy:\n"
+        "      restart_policy:\n"
+        "        condition: on-failure\n"
+        "    profiles:\n"
+        "      - disabled\n"
+        "      # - other\n"
+        "      - \"scraper\"\n"
+        "    environment:\n"
+        "      - restart=no\n"
+        "  init:\n"
+        "    restart: \"no\"  # runs once\n"
+        "    profiles: [\"bootstrap\", extra]\n"
+        "    command:\n"
+        "    - sh\n"
+    )
+
+    services = update_dashboard.read_compose(compose, "jobs")["services"]
+
+    assert [(s["service"], s["restart"], s["profiles"]) for s in services] == [
+        ("app", "unless-stopped", ["disabled", "scraper"]),
+        ("init", "no", ["bootstrap", "extra"])
+    ]
+
+
+def detail_dashboard():
+    return update_dashboard.generate_detail_dashboard("shop", {"pattern": "(web|db)", "containers": ["web", "db"]})
+
+
+def find_panel(dashboard, section, title):
+    return update_dashboard.index_panels(dashboard["panels"])[(section, title, 1)]
+
+
+def test_index_panels_keeps_container_rows_apart():
+    indexed = update_dashboard.index_panels(detail_dashboard()["panels"])
+
+    # Every container row has its own CPU panel
+    assert ("web", "CPU", 1) in indexed
+    assert ("db", "CPU", 1) in indexed
+    assert ("row", "web", 1) in indexed
+
+    # Duplicates within one section are numbered
+    duplicated = update_dashboard.index_panels([
+        {"type": "row", "title": "web"}, {"title": "CPU"}, {"title": "CPU"}
+    ])
+    assert [update_dashboard.describe_key(key) for key in duplicated] == ["row web", "web / CPU", "web / CPU #2"]
+
+
+def test_diff_dashboard_identical():
+    assert update_dashboard.diff_dashboard(detail_dashboard(), detail_dashboard()) == []
+
+
+def test_diff_dashboard_ignores_panel_ids():
+    old, new = detail_dashboard(), detail_dashboard()
+    for panel in new["panels"]:
+        panel["id"] += 100
+
+    assert update_dashboard.diff_dashboard(old, new) == []
+
+
+def test_diff_dashboard_query_change():
+    old, new = detail_dashboard(), detail_dashboard()
+    target = find_panel(new, "db", "CPU")["targets"][0]
+    target["expr"] = target["expr"].replace("[5m]", "[1m]")
+
+    changes = update_dashboard.diff_dashboard(old, new)
+
+    assert len(changes) == 1
+    assert changes[0].startswith("db / CPU: target A query changed:")
+    assert "[1m]" in changes[0]
+
+
+def test_diff_dashboard_added_and_removed_panels():
+    old, new = detail_dashboard(), detail_dashboard()
+    new["panels"] = [p for p in new["panels"] if p.get("title") != "Uptime" or p["gridPos"]["y"] != 1]
+    new["panels"].append({"title": "Logs", "type": "logs", "gridPos": {"h": 8, "w": 24, "x": 0, "y": 18}})
+
+    changes = update_dashboard.diff_dashboard(old, new)
+
+    assert "panel removed: web / Uptime" in changes
+    assert "panel added: db / Logs" in changes
+    assert len(changes) == 2
+
+
+def test_diff_dashboard_grid_move():
+    old, new = detail_dashboard(), detail_dashboard()
+    find_panel(new, "web", "Memory")["gridPos"]["x"] = 12
+
+    changes = update_dashboard.diff_dashboard(old, new)
+
+    assert changes == ['panel moved: web / Memory {"h": 8, "w": 5, "x": 11, "y": 1} -> {"h": 8, "w": 5, "x": 12, "y": 1}']
+
+
+def test_diff_dashboard_target_added_and_option_changed():
+    old, new = detail_dashboard(), detail_dashboard()
+    panel = find_panel(new, "web", "Errors")
+    panel["targets"].append({"expr": "vector(1)", "refId": "B"})
+    panel["options"]["colorMode"] = "value"
+
+    changes = update_dashboard.diff_dashboard(old, new)
+
+    assert "web / Errors: target B added: vector(1)" in changes
+    assert 'web / Errors: options.colorMode: "background" -> "value"' in changes
+
+
+def write_compose(root, stack, body):
+    stack_dir = root / "stacks" / stack
+    stack_dir.mkdir(parents=True, exist_ok=True)
+    (stack_dir / "docker-compose.yml").write_text(body)
+
+
+@pytest.fixture
+def stack_tree(tmp_path, monkeypatch):
+    """A small stacks/ tree; output paths are relative to the working directory"""
+    write_compose(tmp_path, "shop", (
+        "services:\n"
+        "  web:\n"
+        "    image: shop/web:1\n"
+        "    container_name: shop_web\n"
+        "    restart: unless-stopped\n"
+        "  worker:\n"
+        "    image: shop/worker:1\n"
+        "    restart: unless-stopped\n"
+    ))
+    write_compose(tmp_path, "blog", (
+        "services:\n"
+        "  blog:\n"
+        "    image: \"ghost:5\"\n"
+        "    container_name: blog\n"
+    ))
+    for path in ("dashboards", "config/prometheus/rules", "textfile"):
+        (tmp_path / "stacks/monitoring" / path).mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_check_dashboards_return_code(stack_tree, capsys):
+    # Nothing generated yet
+    assert update_dashboard.check_dashboards() == 1
+
+    update_dashboard.generate_dashboard()
+    assert update_dashboard.check_dashboards() == 0
+
+    path = stack_tree / "stacks/monitoring/dashboards/stacks/stack-shop.json"
+    dashboard = json.loads(path.read_text())
+    dashboard["panels"][1]["targets"][0]["expr"] = "vector(1)"
+    path.write_text(json.dumps(dashboard))
+    capsys.readouterr()
+
+    assert update_dashboard.check_dashboards() == 1
+    out = capsys.readouterr().out
+    assert "~ ./stacks/monitoring/dashboards/stacks/stack-shop.json" in out
+    assert "shop_web / shop_web Status: target A query changed:" in out
+
+
+def test_discover_stacks_rejects_unknown_and_path_names(stack_tree, capsys):
+    assert list(update_dashboard.discover_stacks(stack_names=["shop"])) == ["shop"]
+
+    assert update_dashboard.discover_stacks(stack_names=["shop", "shopp"]) == {}
+    assert "no docker-compose.yml for stack 'shopp'" in capsys.readouterr().out
+
+    for name in ("../shop", "shop/", "..", ""):
+        assert update_dashboard.discover_stacks(stack_names=[name]) == {}
+        assert "is not a stack name" in capsys.readouterr().out
+
+    assert update_dashboard.main(["--stack", "shopp", "check"]) == 1
+    assert update_dashboard.main(["--stack", "../shop", "generate"]) == 1
+
+
+def test_is_ignored_applies_patterns_in_order():
+    patterns = ["stacks/*", "!stacks/auth", "**/.vols_ssd", "media*"]
+
+    assert update_dashboard.is_ignored("dashy", "stacks/dashy", patterns)
+    assert not update_dashboard.is_ignored("auth", "stacks/auth", patterns)
+    assert update_dashboard.is_ignored(".vols_ssd", "stacks/.vols_ssd", patterns)
+    # A later pattern ignores the stack again
+    assert update_dashboard.is_ignored("media", "stacks/media", patterns + ["!stacks/media", "media"])
+    assert not update_dashboard.is_ignored("media", "stacks/media", patterns + ["!media"])
+
+
+def test_is_ignored_star_does_not_cross_slash():
+    assert not update_dashboard.is_ignored("auth", "stacks/auth", ["*/x", "s*h"])
+    assert update_dashboard.is_ignored("auth", "stacks/auth", ["s*/a?th"])
+    assert update_dashboard.is_ignored("auth", "stacks/auth", ["**/auth"])
+    assert update_dashboard.is_ignored("auth", "stacks/auth", ["stacks/[a-c]*"])
+    assert not update_dashboard.is_ignored("auth", "stacks/auth", ["stacks/[!a]*"])
+
+
+def test_read_stackr_registry(tmp_path):
+    registry = tmp_path / ".stackr.yaml"
+
+    registry.write_text("stacks_dir: apps\nstacks: [auth, \"media\"]  # pinned\n")
+    assert update_dashboard.read_stackr_registry(registry) == ("apps", ["auth", "media"])
+
+    registry.write_text((
+        "stacks_dir: \"apps\"\n"
+        "stacks:\n"
+        "  - auth\n"
+        "  # - dashy\n"
+        "  - 'media'\n"
+        "env:\n"
+        "  stacks:\n"
+        "    - nested\n"
+    ))
+    assert update_dashboard.read_stackr_registry(registry) == ("apps", ["auth", "media"])
+
+    # Only a nested stacks: key, no list
+    registry.write_text("env:\n  stacks:\n    - nested\n")
+    assert update_dashboard.read_stackr_registry(registry) == (None, None)
+
+    assert update_dashboard.read_stackr_registry(tmp_path / "missing.yaml") == (None, None)
+
+
+def test_discover_stacks_scan_skips_ignored(stack_tree):
+    write_compose(stack_tree, "archive", "services:\n  old:\n    container_name: old\n")
+    write_compose(stack_tree, ".vols_ssd", "services:\n  data:\n    container_name: data\n")
+    (stack_tree / "stacks" / "notes.txt").write_text("not a stack\n")
+    (stack_tree / ".dockerignore").write_text("**/.vols_ssd\nstacks/*\n!stacks/shop\n")
+    (stack_tree / "stacks" / ".stackrignore").write_text("# stacks dir patterns\n!blog\n")
+
+    stacks = update_dashboard.discover_stacks()
+
+    # monitoring has no compose file in the fixture and isn't a stack
+    assert list(stacks) == ["blog", "shop"]
+    assert stacks["shop"]["services"] == [
+        {"service": "web", "container": "shop_web", "image": "shop/web:1", "oneshot": False, "profiles": []},
+        {"service": "worker", "container": "shop-worker-1", "image": "shop/worker:1", "oneshot": False, "profiles": []},
+    ]
+
+
+def test_stack_availability_counts_only_long_running_containers():
+    rules = {rule["record"]: rule["expr"] for group in update_dashboard.build_recording_rules() for rule in group["rules"]}
+    expr = rules["stackr:stack_availability:ratio_1h"]
+
+    long_running = 'stackr_container_info{oneshot="false",profiles=""}'
+    assert expr.count(long_running) == 3
+    assert "stackr_container_info)" not in expr
+
+
+def test_build_stack_index_and_container_info(stack_tree):
+    write_compose(stack_tree, "odd", (
+        "name: odd-project\n"
+        "services:\n"
+        "  app:\n"
+        "    image: 'registry\\local/app\"x'\n"
+        "    restart: \"no\"\n"
+        "    profiles: [setup]\n"
+    ))
+
+    index = update_dashboard.build_stack_index(update_dashboard.discover_stacks())
+
+    assert index["shop"]["containers"] == ["shop_web", "shop-worker-1"]
+    assert index["shop"]["images"] == ["shop/web:1", "shop/worker:1"]
+    # Compose names containers without container_name after the project, not the directory
+    assert index["odd"]["project"] == "odd-project"
+    assert index["odd"]["containers"] == ["odd-project-app-1"]
+
+    lines = update_dashboard.render_container_info(index).splitlines()
+
+    assert lines[0].startswith("# HELP stackr_container_info ")
+    assert lines[1] == "# TYPE stackr_container_info gauge"
+    assert len(lines) == 2 + 4
+    assert 'stackr_container_info{stack="odd",project="odd-project",service="app",container="odd-project-app-1",' \
+           'name="odd-project-app-1",image="registry\\\\local/app\\"x",oneshot="true",profiles="setup"} 1' in lines
+    assert 'stackr_container_info{stack="shop",project="shop",service="worker",container="shop-worker-1",' \
+           'name="shop-worker-1",image="shop/worker:1",oneshot="false",profiles=""} 1' in lines
+
+
+def test_container_info_rejects_duplicate_names(stack_tree, capsys):
+    write_compose(stack_tree, "blog2", "services:\n  blog:\n    image: ghost:5\n    container_name: blog\n")
+
+    index = update_dashboard.build_stack_index(update_dashboard.discover_stacks())
+    with pytest.raises(ValueError, match="'blog' is used by both blog/blog and blog2/blog"):
+        update_dashboard.render_container_info(index)
+
+    assert update_dashboard.generate_index() == 1
+    assert update_dashboard.main(["generate"]) == 1
+    assert "Error: container name 'blog'" in capsys.readouterr().out
+    assert not (stack_tree / "stacks/monitoring/dashboards/stack-overview.json").exists()
@@ -1,47 +1,328 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
 import json
+import math
 import os
+import random
 import re
+import sys
+import time
 from pathlib import Path
 import urllib.parse
 
 # Configuration
 DOZZLE_URL = "https://logs.vulpe.dev"
 DASHBOARD_OUTPUT_DIR = "./stacks/monitoring/dashboards"
+STACKR_REGISTRY_FILE = "./.stackr.yaml"
+IGNORE_FILES = (".dockerignore", ".stackrignore")
+# Also the TTL of the monitoring stack's query-cache (QUERY_CACHE_TTL), keep them in sync
+DASHBOARD_REFRESH = "30s"
+# Backend URLs as seen from inside the monitoring network
+PROMETHEUS_URL = "http://prometheus:9090"
+QUERY_CACHE_URL = "http://query-cache:9091"
+LOKI_URL = "http://loki:3100"
+SCRAPE_INTERVAL = 15
+LOADTEST_MAX_DATA_POINTS = 1000
+RULES_OUTPUT_FILE = "./stacks/monitoring/config/prometheus/rules/stackr-rollups.yml"
+INDEX_OUTPUT_FILE = "./stacks/monitoring/stackr-index.json"
+TEXTFILE_OUTPUT_FILE = "./stacks/monitoring/textfile/stackr_container_info.prom"
 
-def discover_stacks(stacks_dir="./stacks"):
+def read_stackr_registry(registry_file=STACKR_REGISTRY_FILE):
     """
-    Auto-discover stacks by scanning the stacks directory.
-    Reads docker-compose.yml files to find container_name declarations.
-    Returns a dict mapping stack_name -> {"pattern": pattern, "containers": [list of container names]}
+    Read stacks_dir and an optional top-level `stacks:` list from .stackr.yaml.
+    Only top-level keys are parsed (no YAML dependency), nested `stacks:` keys are ignored.
+    Returns (stacks_dir or None, [stack names] or None)
     """
-    stacks = {}
-    stacks_path = Path(stacks_dir)
+    stacks_dir = None
+    stack_names = None
 
-    if not stacks_path.exists():
-        print(f"Error: Stacks directory '{stacks_dir}' not found")
-        return stacks
+    try:
+        with open(registry_file, 'r') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return stacks_dir, stack_names
+
+    in_stacks_list = False
+    for line in lines:
+        line = line.split('#', 1)[0].rstrip()
+        if not line:
+            continue
 
-    for stack_dir in sorted(stacks_path.iterdir()):
-        if not stack_dir.is_dir():
+        # Match: stacks_dir: some/path
+        match = re.match(r'stacks_dir:\s*(.+)', line)
+        if match:
+            stacks_dir = match.group(1).strip().strip('"\'')
+            in_stacks_list = False
             continue
 
-        compose_file = stack_dir / "docker-compose.yml"
-        if not compose_file.exists():
+        # Match: stacks: [a, b] or stacks: followed by "- name" items
+        match = re.match(r'stacks:\s*(.*)', line)
+        if match:
+            inline = match.group(1).strip()
+            stack_names = []
+            if inline.startswith('['):
+                stack_names = [n.strip().strip('"\'') for n in inline.strip('[]').split(',') if n.strip()]
+            else:
+                in_stacks_list = True
             continue
 
-        stack_name = stack_dir.name
-        container_names = []
+        if in_stacks_list:
+            match = re.match(r'\s*-\s*(.+)', line)
+            if match:
+                stack_names.append(match.group(1).strip().strip('"\''))
+            elif not line[0].isspace():
+                in_stacks_list = False
+
+    return stacks_dir, stack_names
+
+def read_ignore_patterns(stacks_path):
+    """
+    Collect patterns from .dockerignore and .stackrignore in the project root and the stacks directory,
+    in that order. Lines starting with ! re-include entries, as in Docker the last matching line wins.
+    """
+    patterns = []
+    for directory in (stacks_path.parent, stacks_path):
+        for name in IGNORE_FILES:
+            try:
+                with open(directory / name, 'r') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith('#'):
+                            patterns.append(line)
+            except FileNotFoundError:
+                continue
+    return patterns
+
+def ignore_pattern_regex(pattern):
+    """
+    Translate a .dockerignore glob to a regex: * and ? don't cross /, ** matches any number of
+    directories and [...] is a character class.
+    """
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            chars = pattern[i + 1:end]
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            regex += f'[{chars}]'
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex)
+
+def is_ignored(name, rel_path, patterns):
+    """
+    Apply ignore patterns in order to a stack directory, matching either its path relative to the
+    project root or its bare name. A ! pattern that matches un-ignores it again.
+    """
+    ignored = False
+    for pattern in patterns:
+        negate = pattern.startswith('!')
+        pattern = pattern.lstrip('!').strip().strip('/')
+        regex = ignore_pattern_regex(pattern)
+        if regex.fullmatch(rel_path) or regex.fullmatch(name):
+            ignored = not negate
+    return ignored
+
+def normalize_image(image):
+    """
+    Resolve compose variable references in an image so they don't end up in Prometheus labels.
+    ${VAR:-default} and ${VAR-default} become the default, other references are dropped along with
+    a dangling tag/digest separator: "ghcr.io/app:${TAG}" -> "ghcr.io/app".
+    Returns None if nothing is left.
+    """
+    image = re.sub(r'\$\{[A-Za-z_][A-Za-z0-9_]*(?::?-([^}]*))?\}', lambda m: m.group(1) or '', image)
+    image = re.sub(r'\$[A-Za-z_][A-Za-z0-9_]*', '', image)
+    image = image.rstrip(':@')
+    return image or None
+
+def strip_value(value):
+    """Strip a trailing comment and quotes from a scalar YAML value"""
+    return re.sub(r'(^|\s+)#.*$', '', value).strip().strip('"\'')
+
+def read_compose(compose_file, stack_name):
+    """
+    Extract the compose project name, services and their image, container_name, restart and profiles
+    values from a docker-compose.yml. Returns None if the file doesn't exist.
+    """
+    project = stack_name
+    container_names = []
+    services = []
+    in_services = False
+    service_indent = None
+    key_indent = None
+    in_profiles = False
 
-        # Read docker-compose.yml and extract container_name values
+    # Read docker-compose.yml line by line (no YAML dependency)
+    try:
         with open(compose_file, 'r') as f:
             for line in f:
+                # Skip blank and commented-out lines for both container names and services
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+
                 # Match: container_name: some_name
                 match = re.search(r'container_name:\s*(.+)', line)
                 if match:
                     container_name = match.group(1).strip()
                     container_names.append(container_name)
 
+                indent = len(line) - len(line.lstrip())
+                if indent == 0:
+                    # Top-level key: services:, networks:, name: ...
+                    match = re.match(r'([\w.-]+):\s*(.*)', line)
+                    in_services = bool(match) and match.group(1) == 'services'
+                    if match and match.group(1) == 'name' and match.group(2).strip():
+                        project = match.group(2).strip().strip('"\'')
+                    continue
+
+                if not in_services:
+                    continue
+
+                if service_indent is None:
+                    service_indent = indent
+
+                match = re.match(r'\s*([\w.-]+):\s*$', line)
+                if indent == service_indent and match:
+                    services.append({
+                        "service": match.group(1), "container_name": None, "image": None,
+                        "restart": None, "profiles": []
+                    })
+                    key_indent = None
+                    in_profiles = False
+                    continue
+
+                if not services or indent <= service_indent:
+                    continue
+
+                # Block list items under profiles: (may sit at the key's own indent)
+                match = re.match(r'\s*-\s*(.+)', line)
+                if in_profiles and match and indent >= key_indent:
+                    services[-1]['profiles'].append(strip_value(match.group(1)))
+                    continue
+
+                # Only the service's own keys, not nested ones like deploy.restart_policy
+                if key_indent is None:
+                    key_indent = indent
+                in_profiles = False
+                if indent != key_indent:
+                    continue
+
+                match = re.match(r'\s*(image|container_name|restart|profiles):\s*(.*)', line)
+                if not match:
+                    continue
+                key, value = match.group(1), strip_value(match.group(2))
+                if key == 'profiles':
+                    if value.startswith('['):
+                        services[-1]['profiles'] = [strip_value(p) for p in value.strip('[]').split(',') if p.strip()]
+                    else:
+                        in_profiles = True
+                elif value and services[-1][key] is None:
+                    services[-1][key] = normalize_image(value) if key == 'image' else value
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    return {"project": project, "containers": container_names, "services": services}
+
+def stack_name_errors(stacks_path, stack_names):
+    """
+    Validate an explicit stack list: each name must be a single directory under stacks_path
+    containing a docker-compose.yml. Returns a list of error messages.
+    """
+    errors = []
+    for stack_name in stack_names:
+        separators = {'/', os.sep} | ({os.altsep} if os.altsep else set())
+        if not stack_name or stack_name in ('.', '..') or any(sep in stack_name for sep in separators):
+            errors.append(f"'{stack_name}' is not a stack name")
+        elif not (stacks_path / stack_name / "docker-compose.yml").is_file():
+            errors.append(f"no docker-compose.yml for stack '{stack_name}' in {stacks_path}")
+    return errors
+
+def discover_stacks(stacks_dir=None, stack_names=None):
+    """
+    Auto-discover stacks by scanning the stacks directory.
+    Reads docker-compose.yml files to find container_name declarations.
+    Returns a dict mapping stack_name -> {"pattern": pattern, "containers": [list of container names],
+    "project": compose project, "compose_file": path,
+    "services": [{"service", "container", "image", "oneshot", "profiles"}]}
+
+    The stacks directory is read with a single os.scandir pass and stack directories are never
+    descended into beyond opening their compose file, so bind-mounted data living beside the
+    compose files doesn't affect startup. Entries matched by .dockerignore/.stackrignore are skipped.
+    If stack_names is given (or .stackr.yaml lists `stacks:`), no scan happens at all; every listed
+    name must then be a stack directory with a compose file, otherwise nothing is returned.
+    """
+    stacks = {}
+
+    registry_dir, registry_names = read_stackr_registry()
+    stacks_path = Path(stacks_dir or registry_dir or "./stacks")
+    if stack_names is None:
+        stack_names = registry_names
+
+    if not stacks_path.is_dir():
+        print(f"Error: Stacks directory '{stacks_path}' not found")
+        return stacks
+
+    if stack_names is not None:
+        # An explicit list must name real stacks, a typo would otherwise pass check silently
+        source = "--stack" if stack_names is not registry_names else STACKR_REGISTRY_FILE
+        errors = stack_name_errors(stacks_path, stack_names)
+        for error in errors:
+            print(f"Error: {source}: {error}")
+        if errors:
+            return stacks
+        candidates = sorted(stack_names)
+    else:
+        patterns = read_ignore_patterns(stacks_path)
+        with os.scandir(stacks_path) as it:
+            # DirEntry.is_dir() uses the cached d_type, no extra stat per entry
+            candidates = sorted(
+                entry.name for entry in it
+                if entry.is_dir()
+                and not is_ignored(entry.name, f"{stacks_path.name}/{entry.name}", patterns)
+            )
+
+    for stack_name in candidates:
+        compose_file = stacks_path / stack_name / "docker-compose.yml"
+        compose = read_compose(compose_file, stack_name)
+        if compose is None:
+            continue
+
+        container_names = compose['containers']
+        # Containers without container_name get Compose's generated name: project-service-1
+        services = [
+            {
+                "service": service['service'],
+                "container": service['container_name'] or f"{compose['project']}-{service['service']}-1",
+                "image": service['image'],
+                # One-shot and profile-gated containers aren't expected to be running
+                "oneshot": service['restart'] == 'no',
+                "profiles": service['profiles']
+            }
+            for service in compose['services']
+        ]
+        index = {
+            "project": compose['project'],
+            "compose_file": str(compose_file),
+            "services": services
+        }
+
         if container_names:
             # If multiple containers, create a regex group pattern
             if len(container_names) == 1:
@@ -55,23 +336,37 @@ def discover_stacks(stacks_dir="./stacks"):
 
             stacks[stack_name] = {
                 "pattern": pattern,
-                "containers": container_names
+                "containers": container_names,
+                **index
             }
         else:
             # No explicit container_name found, use wildcard pattern
             # Docker Compose auto-generates names like: stackname-servicename-1
             stacks[stack_name] = {
                 "pattern": f"{stack_name}.*",
-                "containers": []  # Will be determined at runtime
+                "containers": [],  # Will be determined at runtime
+                **index
             }
 
     return stacks
 
-def create_row_panels(stack_name, pattern, y_position):
+def timed_discover_stacks(stacks_dir=None, stack_names=None):
+    """Run discover_stacks and report how long the scan took"""
+    start = time.perf_counter()
+    stacks = discover_stacks(stacks_dir, stack_names)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Discovered {len(stacks)} stacks in {elapsed_ms:.1f}ms")
+    return stacks
+
+def create_row_panels(stack_name, project, y_position):
     """Create all 6 panels for a single stack row with drilldown link"""
 
     panels = []
 
+    # Metrics are matched to the stack by joining on the stackr_container_info index metric,
+    # logs by the compose project label promtail attaches
+    join = f'* on(name) group_left() stackr_container_info{{stack="{stack_name}"}}'
+
     # Status panel - shows running and total container counts, title links to detail dashboard
     panels.append({
         "datasource": {"type": "prometheus", "uid": "prometheus"},
@@ -103,12 +398,12 @@ def create_row_panels(stack_name, pattern, y_position):
         },
         "targets": [
             {
-                "expr": f'count(count_over_time(container_last_seen{{name=~"{pattern}"}}[1m])) or vector(0)',
+                "expr": f'count(count_over_time(container_last_seen[1m]) {join}) or vector(0)',
                 "refId": "A",
                 "legendFormat": "Running"
             },
             {
-                "expr": f'count(group by (name) (container_start_time_seconds{{name=~"{pattern}"}})) or vector(0)',
+                "expr": f'count(group by (name) (container_start_time_seconds {join})) or vector(0)',
                 "refId": "B",
                 "legendFormat": "Total"
             }
@@ -158,7 +453,7 @@ def create_row_panels(stack_name, pattern, y_position):
         },
         "targets": [
             {
-                "expr": f'sum(rate(container_cpu_usage_seconds_total{{name=~"{pattern}"}}[5m]) * 100)',
+                "expr": f'sum(rate(container_cpu_usage_seconds_total[5m]) {join} * 100)',
                 "refId": "A",
                 "legendFormat": "CPU",
                 "datasource": {"type": "prometheus", "uid": "prometheus"}
@@ -209,7 +504,7 @@ def create_row_panels(stack_name, pattern, y_position):
         },
         "targets": [
             {
-                "expr": f'sum(container_memory_usage_bytes{{name=~"{pattern}"}})',
+                "expr": f'sum(container_memory_usage_bytes {join})',
                 "refId": "A",
                 "legendFormat": "Memory",
                 "datasource": {"type": "prometheus", "uid": "prometheus"}
@@ -249,12 +544,12 @@ def create_row_panels(stack_name, pattern, y_position):
         },
         "targets": [
             {
-                "expr": f'sum(rate(container_network_receive_bytes_total{{name=~"{pattern}"}}[5m]))',
+                "expr": f'sum(rate(container_network_receive_bytes_total[5m]) {join})',
                 "refId": "A",
                 "legendFormat": "RX"
             },
             {
-                "expr": f'sum(rate(container_network_transmit_bytes_total{{name=~"{pattern}"}}[5m]))',
+                "expr": f'sum(rate(container_network_transmit_bytes_total[5m]) {join})',
                 "refId": "B",
                 "legendFormat": "TX"
             }
@@ -293,12 +588,12 @@ def create_row_panels(stack_name, pattern, y_position):
         },
         "targets": [
             {
-                "expr": f'sum(rate(container_fs_reads_bytes_total{{name=~"{pattern}"}}[5m]))',
+                "expr": f'sum(rate(container_fs_reads_bytes_total[5m]) {join})',
                 "refId": "A",
                 "legendFormat": "Read"
             },
             {
-                "expr": f'sum(rate(container_fs_writes_bytes_total{{name=~"{pattern}"}}[5m]))',
+                "expr": f'sum(rate(container_fs_writes_bytes_total[5m]) {join})',
                 "refId": "B",
                 "legendFormat": "Write"
             }
@@ -340,7 +635,7 @@ def create_row_panels(stack_name, pattern, y_position):
         },
         "targets": [
             {
-                "expr": f'sum(count_over_time({{container=~"{pattern}",detected_level="error"}} [$__range])) or vector(0)',
+                "expr": f'sum(count_over_time({{compose_project="{project}",detected_level="error"}} [$__range])) or vector(0)',
                 "refId": "A"
             }
         ],
@@ -675,7 +970,7 @@ def generate_detail_dashboard(stack_name, stack_data):
         "panels": [],
         "schemaVersion": 36,
         "version": 1,
-        "refresh": "30s",
+        "refresh": DASHBOARD_REFRESH,
         "editable": True,
         "links": [
             {
@@ -713,22 +1008,370 @@ def generate_detail_dashboard(stack_name, stack_data):
 
     return dashboard
 
-def generate_dashboard():
-    """Generate dashboard by auto-discovering stacks and creating panels for each"""
+def build_recording_rules():
+    """
+    Build hourly and daily recording-rule rollups per container and per stack.
+    Hourly rules read raw cAdvisor samples once an hour, daily rules only read the hourly rollups,
+    so long-range dashboards never have to touch raw samples.
+    Stack membership comes from joining on stackr_container_info, so the rules are the same for
+    every set of stacks and agree with the overview dashboard and the index.
+    Returns a list of Prometheus rule groups.
+    """
+    join = '* on(name) group_left(stack) stackr_container_info'
+    # Containers expected to be up: one-shot (restart: "no") and profile-gated services are left out
+    long_running = 'stackr_container_info{oneshot="false",profiles=""}'
+    members = f'count by (stack) ({long_running})'
 
-    dashboard_path = "./stacks/monitoring/dashboards/stack-overview.json"
+    # Per-container hourly rollups, labelled with name and stack
+    hourly = [
+        {
+            "record": "stackr:container_availability:ratio_1h",
+            "expr": f'clamp_max(max by (name, stack) (count_over_time(container_last_seen[1h]) {join}) / scalar(max(count_over_time(up{{job="cadvisor"}}[1h]))), 1)'
+        },
+        {
+            "record": "stackr:container_restarts:changes_1h",
+            "expr": f'max by (name, stack) (changes(container_start_time_seconds[1h]) {join})'
+        },
+        {
+            "record": "stackr:container_cpu_percent:avg_1h",
+            "expr": f'sum by (name, stack) (rate(container_cpu_usage_seconds_total[1h]) {join}) * 100'
+        },
+        {
+            "record": "stackr:container_memory_bytes:avg_1h",
+            "expr": f'sum by (name, stack) (avg_over_time(container_memory_usage_bytes[1h]) {join})'
+        },
+        # Per-stack hourly rollups, built from the container rollups above (same group, evaluated in order).
+        # Availability divides by the indexed long-running container count so a container that never
+        # started counts as down, while one-shot and profile-gated containers don't count at all.
+        {
+            "record": "stackr:stack_availability:ratio_1h",
+            "expr": f'(sum by (stack) (stackr:container_availability:ratio_1h * on(name, stack) group_left() {long_running}) or {members} * 0) / {members}'
+        },
+        {"record": "stackr:stack_restarts:changes_1h", "expr": 'sum by (stack) (stackr:container_restarts:changes_1h)'},
+        {"record": "stackr:stack_cpu_percent:avg_1h", "expr": 'sum by (stack) (stackr:container_cpu_percent:avg_1h)'},
+        {"record": "stackr:stack_memory_bytes:avg_1h", "expr": 'sum by (stack) (stackr:container_memory_bytes:avg_1h)'}
+    ]
+    daily = []
 
-    # Auto-discover stacks
-    print("Discovering stacks...")
-    stacks = discover_stacks()
+    # Daily rollups aggregate the 24 hourly samples, for containers and stacks alike
+    for level in ("container", "stack"):
+        by = "name, stack" if level == "container" else "stack"
+        daily.extend([
+            {
+                "record": f"stackr:{level}_availability:ratio_1d",
+                "expr": f'avg by ({by}) (avg_over_time(stackr:{level}_availability:ratio_1h[1d]))'
+            },
+            {
+                "record": f"stackr:{level}_restarts:changes_1d",
+                "expr": f'sum by ({by}) (sum_over_time(stackr:{level}_restarts:changes_1h[1d]))'
+            },
+            {
+                "record": f"stackr:{level}_cpu_percent:avg_1d",
+                "expr": f'avg by ({by}) (avg_over_time(stackr:{level}_cpu_percent:avg_1h[1d]))'
+            },
+            {
+                "record": f"stackr:{level}_memory_bytes:avg_1d",
+                "expr": f'avg by ({by}) (avg_over_time(stackr:{level}_memory_bytes:avg_1h[1d]))'
+            }
+        ])
+
+    return [
+        {"name": "stackr-rollup-1h", "interval": "1h", "rules": hourly},
+        {"name": "stackr-rollup-1d", "interval": "1d", "rules": daily}
+    ]
+
+def render_recording_rules(groups):
+    """Render rule groups as a Prometheus rules file (expressions are JSON-quoted, which is valid YAML)"""
+    lines = [
+        "# Generated by update_dashboard.py - do not edit by hand",
+        "groups:"
+    ]
+    for group in groups:
+        lines.append(f"  - name: {group['name']}")
+        lines.append(f"    interval: {group['interval']}")
+        lines.append("    rules:")
+        for rule in group['rules']:
+            lines.append(f"      - record: {rule['record']}")
+            lines.append(f"        expr: {json.dumps(rule['expr'])}")
+    return "\n".join(lines) + "\n"
+
+def create_slo_row_panels(stack_name, y_position):
+    """Create the SLO panels for a single stack, reading only the daily rollups"""
+    panels = []
+
+    links = [
+        {
+            "title": f"Stackr: {stack_name.title()}",
+            "url": f"/d/stackr-{stack_name}",
+            "targetBlank": False
+        }
+    ]
+
+    # Availability over the selected range
+    panels.append({
+        "datasource": {"type": "prometheus", "uid": "prometheus"},
+        "fieldConfig": {
+            "defaults": {
+                "mappings": [],
+                "thresholds": {
+                    "mode": "absolute",
+                    "steps": [
+                        {"color": "red", "value": None},
+                        {"color": "yellow", "value": 0.99},
+                        {"color": "green", "value": 0.999}
+                    ]
+                },
+                "unit": "percentunit",
+                "decimals": 2
+            }
+        },
+        "gridPos": {"h": 4, "w": 4, "x": 0, "y": y_position},
+        "id": None,
+        "options": {
+            "graphMode": "none",
+            "textMode": "value",
+            "colorMode": "background",
+            "justifyMode": "center"
+        },
+        "targets": [
+            {
+                "expr": f'avg_over_time(stackr:stack_availability:ratio_1d{{stack="{stack_name}"}}[$__range])',
+                "refId": "A"
+            }
+        ],
+        "title": f"{stack_name.title()} Availability",
+        "type": "stat",
+        "links": links
+    })
+
+    # Restarts over the selected range
+    panels.append({
+        "datasource": {"type": "prometheus", "uid": "prometheus"},
+        "fieldConfig": {
+            "defaults": {
+                "mappings": [],
+                "thresholds": {
+                    "mode": "absolute",
+                    "steps": [
+                        {"color": "green", "value": 0},
+                        {"color": "yellow", "value": 1},
+                        {"color": "red", "value": 5}
+                    ]
+                },
+                "unit": "none"
+            }
+        },
+        "gridPos": {"h": 4, "w": 4, "x": 4, "y": y_position},
+        "id": None,
+        "options": {
+            "graphMode": "none",
+            "textMode": "value",
+            "colorMode": "background",
+            "justifyMode": "center"
+        },
+        "targets": [
+            {
+                "expr": f'sum_over_time(stackr:stack_restarts:changes_1d{{stack="{stack_name}"}}[$__range]) or vector(0)',
+                "refId": "A"
+            }
+        ],
+        "title": f"{stack_name.title()} Restarts",
+        "type": "stat",
+        "links": links
+    })
+
+    # Daily mean CPU and memory
+    for title, record, unit, x in (
+        ("Mean CPU", "stackr:stack_cpu_percent:avg_1d", "percent", 8),
+        ("Mean Memory", "stackr:stack_memory_bytes:avg_1d", "bytes", 16)
+    ):
+        panels.append({
+            "datasource": {"type": "prometheus", "uid": "prometheus"},
+            "fieldConfig": {
+                "defaults": {
+                    "unit": unit,
+                    "decimals": 1,
+                    "custom": {
+                        "drawStyle": "bars",
+                        "showPoints": "never",
+                        "fillOpacity": 50,
+                        "lineWidth": 1,
+                        "spanNulls": False,
+                        "stacking": {"mode": "none", "group": "A"},
+                        "hideFrom": {"tooltip": False, "viz": False, "legend": False}
+                    }
+                }
+            },
+            "gridPos": {"h": 4, "w": 8, "x": x, "y": y_position},
+            "id": None,
+            "options": {
+                "legend": {"displayMode": "hidden", "placement": "bottom", "showLegend": False},
+                "tooltip": {"mode": "single", "sort": "none"}
+            },
+            "targets": [
+                {
+                    # Daily rollups get one sample a day, far beyond the 5m lookback of a bare selector
+                    "expr": f'last_over_time({record}{{stack="{stack_name}"}}[1d])',
+                    "refId": "A",
+                    "legendFormat": title,
+                    "interval": "1d"
+                }
+            ],
+            "title": f"{stack_name.title()} {title}",
+            "type": "timeseries",
+            "links": links
+        })
+
+    return panels
+
+def generate_slo_dashboard(stacks):
+    """Generate the long-range SLO dashboard, which only queries the recording-rule rollups"""
+    dashboard = {
+        "uid": "stackr-slo",
+        "title": "Stackr SLO",
+        "panels": [],
+        "schemaVersion": 36,
+        "version": 1,
+        "refresh": "1h",
+        "editable": True,
+        "time": {"from": "now-30d", "to": "now"},
+        "links": [
+            {
+                "title": "Back to Stackr Overview",
+                "url": "/d/stackr-overview",
+                "type": "link",
+                "icon": "dashboard"
+            }
+        ]
+    }
+
+    all_panels = []
+    panel_id = 1
+    y_position = 0
+
+    for stack_name in stacks:
+        row_panels = create_slo_row_panels(stack_name, y_position)
+
+        for panel in row_panels:
+            panel['id'] = panel_id
+            panel_id += 1
+
+        all_panels.extend(row_panels)
+        y_position += 4
+
+    dashboard['panels'] = all_panels
 
+    return dashboard
+
+def build_stack_index(stacks):
+    """
+    Build the persistent container-to-stack index from discovery.
+    Returns a dict mapping stack_name -> {"project", "compose_file", "pattern", "containers", "images", "services"}
+    """
+    index = {}
+    for stack_name, stack_data in stacks.items():
+        services = stack_data.get('services', [])
+        index[stack_name] = {
+            "project": stack_data.get('project', stack_name),
+            "compose_file": stack_data.get('compose_file'),
+            "pattern": stack_data['pattern'],
+            "containers": [service['container'] for service in services],
+            "images": sorted({service['image'] for service in services if service['image']}),
+            "services": services
+        }
+    return index
+
+def escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_container_info(index):
+    """
+    Render the index as node-exporter textfile metrics: one stackr_container_info series per container.
+    Raises ValueError if two services share a container name, joins on(name) would then match many-to-many.
+    """
+    seen = {}
+    for stack_name, entry in index.items():
+        for service in entry['services']:
+            owner = f"{stack_name}/{service['service']}"
+            other = seen.setdefault(service['container'], owner)
+            if other != owner:
+                raise ValueError(f"container name '{service['container']}' is used by both {other} and {owner}")
+
+    lines = [
+        "# HELP stackr_container_info Container to stack mapping from the Stackr index (generated by update_dashboard.py).",
+        "# TYPE stackr_container_info gauge"
+    ]
+    for stack_name, entry in index.items():
+        for service in entry['services']:
+            labels = {
+                "stack": stack_name,
+                "project": entry['project'],
+                "service": service['service'],
+                "container": service['container'],
+                # Same label cAdvisor uses, so dashboards can join with on(name)
+                "name": service['container'],
+                "image": service['image'] or "",
+                "oneshot": "true" if service['oneshot'] else "false",
+                "profiles": ",".join(service['profiles'])
+            }
+            rendered = ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels.items())
+            lines.append(f"stackr_container_info{{{rendered}}} 1")
+    return "\n".join(lines) + "\n"
+
+def build_index_files(stacks):
+    """Render the index JSON and its textfile metrics, returns a dict mapping output path -> contents"""
+    index = build_stack_index(stacks)
+    return {
+        INDEX_OUTPUT_FILE: json.dumps(index, indent=2) + "\n",
+        TEXTFILE_OUTPUT_FILE: render_container_info(index)
+    }
+
+def build_generated_files(stacks):
+    """Render every non-dashboard generated file, returns a dict mapping output path -> contents"""
+    files = {RULES_OUTPUT_FILE: render_recording_rules(build_recording_rules())}
+    files.update(build_index_files(stacks))
+    return files
+
+def write_generated_file(path, contents):
+    """Write atomically, node-exporter may be reading the textfile at the same time"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+
+def generate_index(stacks_dir=None, stack_names=None):
+    """Rewrite only the container-to-stack index, dashboards pick it up without being regenerated"""
+    if stack_names is not None:
+        # A partial index would drop every other stack from the stackr_container_info joins
+        print("Error: the index covers every stack and can't be built from a --stack list")
+        return 1
+
+    stacks = timed_discover_stacks(stacks_dir, stack_names)
     if not stacks:
         print("No stacks found!")
-        return
+        return 1
 
-    print(f"Found {len(stacks)} stacks:")
-    for stack_name, stack_data in stacks.items():
-        print(f"  - {stack_name}: {stack_data['pattern']}")
+    try:
+        index_files = build_index_files(stacks)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    for path, contents in index_files.items():
+        write_generated_file(path, contents)
+        print(f"✓ Written {path}")
+
+    containers = sum(len(stack_data['services']) for stack_data in stacks.values())
+    print(f"✓ Indexed {containers} containers across {len(stacks)} stacks")
+    return 0
+
+def build_overview_dashboard(stacks, dashboard_path):
+    """
+    Build the overview dashboard in memory, preserving metadata from the existing file.
+    Only panels, title and uid are generated; the rest (annotations, links, time settings...) is
+    hand-maintained in the committed file, so `check` cannot report drift in it.
+    """
 
     # Read existing dashboard to preserve metadata
     if os.path.exists(dashboard_path):
@@ -742,7 +1385,7 @@ def generate_dashboard():
             "panels": [],
             "schemaVersion": 36,
             "version": 1,
-            "refresh": "30s"
+            "refresh": DASHBOARD_REFRESH
         }
 
     # Generate all panels
@@ -752,7 +1395,7 @@ def generate_dashboard():
 
     # Create panels for each stack (reusing the same panel structure)
     for stack_name, stack_data in stacks.items():
-        row_panels = create_row_panels(stack_name, stack_data['pattern'], y_position)
+        row_panels = create_row_panels(stack_name, stack_data.get('project', stack_name), y_position)
 
         # Assign IDs to each panel
         for panel in row_panels:
@@ -767,12 +1410,240 @@ def generate_dashboard():
     dashboard['title'] = 'Stackr Overview'
     dashboard['uid'] = 'stackr-overview'
 
-    # Write updated dashboard
-    with open(dashboard_path, 'w') as f:
-        json.dump(dashboard, f, indent=2)
+    return dashboard
+
+def build_dashboards(stacks, aggregates=True):
+    """
+    Build every generated dashboard in memory.
+    Returns a dict mapping output path -> dashboard, overview first.
+    With aggregates=False only the per-stack detail dashboards are built; the overview and SLO
+    dashboards cover every stack and would lose the others when given a partial list.
+    """
+    dashboards = {}
+
+    if aggregates:
+        overview_path = f"{DASHBOARD_OUTPUT_DIR}/stack-overview.json"
+        dashboards[overview_path] = build_overview_dashboard(stacks, overview_path)
+
+    for stack_name, stack_data in stacks.items():
+        detail_path = f"{DASHBOARD_OUTPUT_DIR}/stacks/stack-{stack_name}.json"
+        dashboards[detail_path] = generate_detail_dashboard(stack_name, stack_data)
+
+    if aggregates:
+        slo_path = f"{DASHBOARD_OUTPUT_DIR}/stackr-slo.json"
+        dashboards[slo_path] = generate_slo_dashboard(stacks)
+
+    return dashboards
+
+def panel_key(panel, section):
+    """Key a panel by its row section and title so ids and ordering don't matter"""
+    if panel.get('type') == 'row':
+        return ('row', panel.get('title'))
+    return (section, panel.get('title'))
+
+def index_panels(panels):
+    """Index panels by (row section, title); detail dashboards repeat titles per container row"""
+    indexed = {}
+    section = None
+    for panel in panels:
+        if panel.get('type') == 'row':
+            section = panel.get('title')
+        key = panel_key(panel, section)
+        # Disambiguate duplicate titles within a section by occurrence
+        n = 1
+        while (key + (n,)) in indexed:
+            n += 1
+        indexed[key + (n,)] = panel
+    return indexed
+
+def describe_key(key):
+    section, title, n = key
+    if section == 'row':
+        label = f"row {title}"
+    elif section is None:
+        label = title
+    else:
+        label = f"{section} / {title}"
+    return label if n == 1 else f"{label} #{n}"
+
+def diff_values(old, new, path):
+    """Recursively yield (path, old, new) for every leaf that differs"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new), key=str):
+            yield from diff_values(old.get(key), new.get(key), f"{path}.{key}" if path else str(key))
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for i, (o, n) in enumerate(zip(old, new)):
+            yield from diff_values(o, n, f"{path}[{i}]")
+    elif old != new:
+        yield (path, old, new)
+
+def diff_targets(old_targets, new_targets):
+    """Compare panel targets by refId and yield human-readable changes"""
+    old_by_ref = {t.get('refId'): t for t in old_targets or []}
+    new_by_ref = {t.get('refId'): t for t in new_targets or []}
+
+    for ref_id in sorted(set(old_by_ref) | set(new_by_ref), key=str):
+        if ref_id not in new_by_ref:
+            yield f"target {ref_id} removed"
+        elif ref_id not in old_by_ref:
+            yield f"target {ref_id} added: {new_by_ref[ref_id].get('expr')}"
+        else:
+            for path, old, new in diff_values(old_by_ref[ref_id], new_by_ref[ref_id], ''):
+                if path == 'expr':
+                    yield f"target {ref_id} query changed:\n        - {old}\n        + {new}"
+                else:
+                    yield f"target {ref_id} {path}: {json.dumps(old)} -> {json.dumps(new)}"
+
+def diff_dashboard(old, new):
+    """
+    Structurally diff two dashboards.
+    Panels are matched by title and targets by refId, so only semantic changes are reported.
+    """
+    changes = []
+
+    old_meta = {k: v for k, v in old.items() if k != 'panels'}
+    new_meta = {k: v for k, v in new.items() if k != 'panels'}
+    for path, o, n in diff_values(old_meta, new_meta, ''):
+        changes.append(f"{path}: {json.dumps(o)} -> {json.dumps(n)}")
+
+    old_panels = index_panels(old.get('panels', []))
+    new_panels = index_panels(new.get('panels', []))
+
+    for key in old_panels:
+        if key not in new_panels:
+            changes.append(f"panel removed: {describe_key(key)}")
+
+    for key, new_panel in new_panels.items():
+        label = describe_key(key)
+        if key not in old_panels:
+            changes.append(f"panel added: {label}")
+            continue
+
+        old_panel = old_panels[key]
+
+        old_pos, new_pos = old_panel.get('gridPos'), new_panel.get('gridPos')
+        if old_pos != new_pos:
+            changes.append(f"panel moved: {label} {json.dumps(old_pos)} -> {json.dumps(new_pos)}")
+
+        for change in diff_targets(old_panel.get('targets'), new_panel.get('targets')):
+            changes.append(f"{label}: {change}")
+
+        # Panel ids are reassigned on every run, so they are not a semantic change
+        ignored = ('id', 'gridPos', 'targets')
+        old_rest = {k: v for k, v in old_panel.items() if k not in ignored}
+        new_rest = {k: v for k, v in new_panel.items() if k not in ignored}
+        for path, o, n in diff_values(old_rest, new_rest, ''):
+            changes.append(f"{label}: {path}: {json.dumps(o)} -> {json.dumps(n)}")
+
+    return changes
+
+def check_dashboards(stacks_dir=None, stack_names=None):
+    """
+    Regenerate all dashboards in memory and structurally diff them against the committed files.
+    Returns 0 when they match and 1 when anything changed, so it can run as a pre-commit hook.
+    The overview's hand-maintained metadata is carried over from the committed file, so only its
+    panels, title and uid are checked. With an explicit stack list (--stack) only those stacks'
+    detail dashboards are checked, the aggregate outputs need every stack.
+    """
+    start = time.perf_counter()
+
+    stacks = timed_discover_stacks(stacks_dir, stack_names)
+    if not stacks:
+        print("No stacks found!")
+        return 1
+
+    # --stack selects a subset; the .stackr.yaml registry list is the full set of stacks
+    aggregates = stack_names is None
+    dashboards = build_dashboards(stacks, aggregates)
+    changed = 0
+
+    for path, dashboard in dashboards.items():
+        if not os.path.exists(path):
+            print(f"+ {path}: new dashboard ({len(dashboard['panels'])} panels)")
+            changed += 1
+            continue
+
+        with open(path, 'r') as f:
+            committed = json.load(f)
+
+        changes = diff_dashboard(committed, dashboard)
+        if changes:
+            changed += 1
+            print(f"~ {path}")
+            for change in changes:
+                print(f"    {change}")
+
+    try:
+        generated_files = build_generated_files(stacks) if aggregates else {}
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    for path, contents in generated_files.items():
+        try:
+            with open(path, 'r') as f:
+                committed_contents = f.read()
+        except FileNotFoundError:
+            committed_contents = None
+        if committed_contents != contents:
+            print(f"~ {path}: out of date")
+            changed += 1
+
+    # Detail dashboards for stacks that no longer exist (meaningless when only some stacks were asked for)
+    stacks_subdir = f"{DASHBOARD_OUTPUT_DIR}/stacks"
+    if aggregates and os.path.isdir(stacks_subdir):
+        for name in sorted(os.listdir(stacks_subdir)):
+            path = f"{stacks_subdir}/{name}"
+            if name.startswith('stack-') and name.endswith('.json') and path not in dashboards:
+                print(f"- {path}: stack no longer discovered")
+                changed += 1
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if changed:
+        print(f"\n✗ {changed} generated files out of date ({elapsed_ms:.0f}ms), run 'make generate'")
+        return 1
+
+    if not aggregates:
+        print(f"✓ {len(dashboards)} detail dashboards up to date ({elapsed_ms:.0f}ms), overview, SLO, rules and index not checked for a partial --stack list")
+        return 0
+
+    print(f"✓ {len(dashboards)} dashboards, recording rules and index up to date ({elapsed_ms:.0f}ms)")
+    return 0
+
+def generate_dashboard(stacks_dir=None, stack_names=None):
+    """Generate dashboard by auto-discovering stacks and creating panels for each. Returns an exit code"""
+
+    # Auto-discover stacks
+    print("Discovering stacks...")
+    stacks = timed_discover_stacks(stacks_dir, stack_names)
+
+    if not stacks:
+        print("No stacks found!")
+        return 1
+
+    print(f"Found {len(stacks)} stacks:")
+    for stack_name, stack_data in stacks.items():
+        print(f"  - {stack_name}: {stack_data['pattern']}")
+
+    # --stack selects a subset; the .stackr.yaml registry list is the full set of stacks
+    aggregates = stack_names is None
+    dashboards = build_dashboards(stacks, aggregates)
+
+    # Render the rules and index up front so a bad index doesn't leave dashboards half-written
+    try:
+        generated_files = build_generated_files(stacks) if aggregates else {}
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if aggregates:
+        overview_path, overview = next(iter(dashboards.items()))
 
-    print(f"\n✓ Generated overview dashboard with {len(all_panels)} panels ({len(stacks)} stacks × 6 panels each)")
-    print(f"✓ Written to {dashboard_path}")
+        # Write updated dashboard
+        with open(overview_path, 'w') as f:
+            json.dump(overview, f, indent=2)
+
+        print(f"\n✓ Generated overview dashboard with {len(overview['panels'])} panels ({len(stacks)} stacks × 6 panels each)")
+        print(f"✓ Written to {overview_path}")
 
     # Generate detail dashboards for each stack
     print(f"\nGenerating detail dashboards...")
@@ -782,16 +1653,311 @@ def generate_dashboard():
     os.makedirs(stacks_subdir, exist_ok=True)
 
     for stack_name, stack_data in stacks.items():
-        detail_dashboard = generate_detail_dashboard(stack_name, stack_data)
         detail_path = f"{stacks_subdir}/stack-{stack_name}.json"
 
         with open(detail_path, 'w') as f:
-            json.dump(detail_dashboard, f, indent=2)
+            json.dump(dashboards[detail_path], f, indent=2)
 
         container_count = len(stack_data['containers']) if stack_data['containers'] else 1
         print(f"  ✓ {stack_name}: {container_count} containers → {detail_path}")
 
     print(f"\n✓ Generated {len(stacks)} detail dashboards")
 
+    if not aggregates:
+        print("✓ Skipped overview, SLO dashboard, recording rules and index (they need every stack, not a --stack list)")
+        return 0
+
+    # Long-range SLO dashboard backed by recording-rule rollups
+    slo_path = f"{DASHBOARD_OUTPUT_DIR}/stackr-slo.json"
+    with open(slo_path, 'w') as f:
+        json.dump(dashboards[slo_path], f, indent=2)
+
+    print(f"✓ Generated SLO dashboard → {slo_path}")
+
+    # Recording rules and the container-to-stack index
+    for path, contents in generated_files.items():
+        write_generated_file(path, contents)
+        print(f"✓ Written {path}")
+    return 0
+
+def find_dashboard(uid):
+    """Find a generated dashboard on disk by uid"""
+    for root, _, files in os.walk(DASHBOARD_OUTPUT_DIR):
+        for name in sorted(files):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(root, name), 'r') as f:
+                dashboard = json.load(f)
+            if dashboard.get('uid') == uid:
+                return dashboard
+    return None
+
+def parse_duration(value):
+    """Parse a Grafana/Prometheus duration such as 30s, 5m or 1d into seconds"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+    match = re.fullmatch(r'(\d+)([smhdwy])', value.strip())
+    if not match:
+        raise ValueError(f"invalid duration: {value!r}")
+    return int(match.group(1)) * units[match.group(2)]
+
+def format_seconds(seconds):
+    if seconds % 86400 == 0:
+        return f"{seconds // 86400}d"
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+def query_interval(range_seconds, min_interval):
+    """Approximate Grafana's $__interval: range / max data points, rounded, never below min_interval"""
+    interval = range_seconds / LOADTEST_MAX_DATA_POINTS
+    for candidate in (1, 5, 10, 15, 30, 60, 300, 600, 900, 1800, 3600, 7200, 21600, 43200, 86400):
+        if interval <= candidate:
+            interval = candidate
+            break
+    return max(int(interval), int(min_interval))
+
+def expand_macros(expr, range_seconds, interval):
+    """Expand the Grafana macros used in generated queries"""
+    rate_interval = max(interval + SCRAPE_INTERVAL, 4 * SCRAPE_INTERVAL)
+    replacements = {
+        "$__rate_interval": format_seconds(rate_interval),
+        "$__interval_ms": str(interval * 1000),
+        "$__interval": format_seconds(interval),
+        "$__range_ms": str(range_seconds * 1000),
+        "$__range_s": str(range_seconds),
+        "$__range": format_seconds(range_seconds)
+    }
+    # Longest macro first so $__range doesn't eat $__range_s
+    for macro, value in replacements.items():
+        expr = expr.replace(macro, value)
+    return expr
+
+def extract_loadtest_queries(dashboard, range_seconds, urls):
+    """
+    Turn every panel target into a concrete HTTP request the way Grafana would issue it.
+    Returns a list of (panel label, [(url, params), ...]).
+    """
+    panels = []
+    for key, panel in index_panels(dashboard.get('panels', [])).items():
+        panel_ds = (panel.get('datasource') or {}).get('type')
+        requests = []
+
+        for target in panel.get('targets', []):
+            ds = (target.get('datasource') or {}).get('type', panel_ds)
+            if ds not in urls or not target.get('expr'):
+                continue
+
+            min_interval = parse_duration(target['interval']) if target.get('interval') else SCRAPE_INTERVAL
+            interval = query_interval(range_seconds, min_interval)
+            expr = expand_macros(target['expr'], range_seconds, interval)
+
+            if ds == 'loki':
+                path = "/loki/api/v1/query_range"
+            else:
+                path = "/api/v1/query_range"
+            requests.append((urls[ds] + path, {"query": expr, "step": interval}))
+
+        if requests:
+            panels.append((describe_key(key), requests))
+
+    return panels
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+async def http_get(url, params):
+    """Minimal HTTP/1.1 GET over asyncio streams, returns the status code"""
+    parts = urllib.parse.urlsplit(url)
+    secure = parts.scheme == 'https'
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or (443 if secure else 80), ssl=secure or None
+    )
+    try:
+        request = (
+            f"GET {parts.path}?{urllib.parse.urlencode(params)} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Accept: application/json\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        # Read the whole body, as Grafana would
+        await reader.read()
+        return status
+    finally:
+        writer.close()
+
+async def run_viewer(panels, range_seconds, refresh, cycles, start_offset, max_concurrent, timeout, samples):
+    """
+    One simulated viewer: opens the dashboard after start_offset, then reloads every refresh.
+    All panels load concurrently, limited to max_concurrent requests like a browser.
+    A request that takes longer than timeout seconds is abandoned and counted as an error.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+    await asyncio.sleep(start_offset)
+
+    async def fetch(url, params):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(http_get(url, params), timeout) == 200
+            except (asyncio.TimeoutError, OSError, ValueError, IndexError):
+                return False
+
+    async def load_panel(label, requests, end):
+        start = time.perf_counter()
+        fetches = []
+        for url, params in requests:
+            # Loki takes nanosecond timestamps
+            scale = 10**9 if "/loki/api/" in url else 1
+            fetches.append(fetch(url, dict(params, start=(end - range_seconds) * scale, end=end * scale)))
+        results = await asyncio.gather(*fetches)
+        elapsed = time.perf_counter() - start
+        samples['panels'].setdefault(label, []).append(elapsed)
+        samples['errors'][label] = samples['errors'].get(label, 0) + results.count(False)
+
+    for cycle in range(cycles):
+        cycle_start = time.perf_counter()
+        end = int(time.time())
+        await asyncio.gather(*(load_panel(label, requests, end) for label, requests in panels))
+        elapsed = time.perf_counter() - cycle_start
+        samples['dashboard'].append(elapsed)
+        # Wait for the next refresh, but not after the last load
+        if cycle < cycles - 1:
+            await asyncio.sleep(max(0, refresh - elapsed))
+
+async def start_stub_backend(latency, received=None):
+    """
+    Local stub answering every query with an empty result after a fixed latency.
+    If received is a list, each request line (e.g. "GET /api/v1/query_range?... HTTP/1.1") is appended to it.
+    """
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            if received is not None:
+                received.append(request_line.decode().strip())
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            await asyncio.sleep(latency)
+            body = b'{"status":"success","data":{"resultType":"matrix","result":[]}}'
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+async def loadtest_async(dashboard, args):
+    range_seconds = parse_duration(args.range)
+    refresh = parse_duration(args.refresh or dashboard.get('refresh') or DASHBOARD_REFRESH)
+    urls = {"prometheus": args.query_cache_url if args.through_cache else args.prometheus_url, "loki": args.loki_url}
+
+    stub = None
+    if args.stub:
+        stub = await start_stub_backend(args.stub_latency)
+        stub_url = f"http://127.0.0.1:{stub.sockets[0].getsockname()[1]}"
+        urls = {"prometheus": stub_url, "loki": stub_url}
+
+    panels = extract_loadtest_queries(dashboard, range_seconds, urls)
+    query_count = sum(len(requests) for _, requests in panels)
+    print(f"Load testing '{dashboard.get('title')}': {len(panels)} panels, {query_count} queries, "
+          f"{args.viewers} viewers × {args.cycles} loads, refresh {format_seconds(refresh)}, range {args.range}")
+    print(f"  prometheus: {urls['prometheus']}\n  loki: {urls['loki']}\n")
+
+    samples = {"panels": {}, "errors": {}, "dashboard": []}
+    try:
+        await asyncio.gather(*(
+            run_viewer(panels, range_seconds, refresh, args.cycles,
+                       random.uniform(0, refresh) if args.cycles > 1 else 0,
+                       args.max_concurrent, args.timeout, samples)
+            for _ in range(args.viewers)
+        ))
+    finally:
+        if stub:
+            stub.close()
+            await stub.wait_closed()
+
+    return panels, samples
+
+def loadtest(uid, args):
+    """
+    Simulate viewers opening a generated dashboard and report per-panel and total latency.
+    Returns 0 on success, 1 if the dashboard is missing or any query failed.
+    """
+    dashboard = find_dashboard(uid)
+    if dashboard is None:
+        print(f"Error: no generated dashboard with uid '{uid}' in {DASHBOARD_OUTPUT_DIR}")
+        return 1
+
+    panels, samples = asyncio.run(loadtest_async(dashboard, args))
+
+    width = max(len(label) for label, _ in panels) if panels else 10
+    print(f"{'panel':<{width}} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for label, _ in panels:
+        latencies = samples['panels'].get(label, [])
+        print(f"{label:<{width}} {percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} "
+              f"{samples['errors'].get(label, 0):>7}")
+
+    total = samples['dashboard']
+    errors = sum(samples['errors'].values())
+    print(f"{'total (dashboard load)':<{width}} {percentile(total, 50) * 1000:>9.1f} {percentile(total, 99) * 1000:>9.1f} {errors:>7}")
+
+    return 1 if errors else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Stackr Grafana dashboards from the stacks directory")
+    parser.add_argument("--stacks-dir", help="Stacks directory (default: stacks_dir from .stackr.yaml, else ./stacks)")
+    parser.add_argument("--stack", dest="stacks", action="append", metavar="NAME",
+                        help="Only use this stack, skipping the directory scan (repeatable); only its detail dashboard is generated/checked")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("generate", help="Regenerate and write all dashboards (default)")
+    subparsers.add_parser("check", help="Structurally diff generated dashboards against the committed files")
+    subparsers.add_parser("index", help="Rewrite only the container-to-stack index and its textfile metrics")
+    loadtest_parser = subparsers.add_parser(
+        "loadtest", help="Simulate viewers opening a generated dashboard and report query latency",
+        description="The default URLs only resolve inside the monitoring Docker network and no ports are published, "
+                    "so run from a container on that network or pass reachable URLs, e.g. through an SSH tunnel: "
+                    "--prometheus-url http://localhost:9090 --loki-url http://localhost:3100"
+    )
+    loadtest_parser.add_argument("uid", help="Dashboard uid, e.g. stackr-overview")
+    loadtest_parser.add_argument("--viewers", type=int, default=5, help="Concurrent viewers (default: 5)")
+    loadtest_parser.add_argument("--cycles", type=int, default=1, help="Dashboard loads per viewer, one per refresh (default: 1)")
+    loadtest_parser.add_argument("--refresh", help="Refresh interval (default: the dashboard's)")
+    loadtest_parser.add_argument("--range", default="6h", help="Dashboard time range (default: 6h)")
+    loadtest_parser.add_argument("--max-concurrent", type=int, default=6, help="Concurrent requests per viewer, like a browser (default: 6)")
+    loadtest_parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds, counted as an error (default: 30)")
+    loadtest_parser.add_argument("--prometheus-url", default=PROMETHEUS_URL)
+    loadtest_parser.add_argument("--through-cache", action="store_true",
+                                 help="Query Prometheus through the query-cache like Grafana does, "
+                                      "repeat loads then measure cache hits")
+    loadtest_parser.add_argument("--query-cache-url", default=QUERY_CACHE_URL)
+    loadtest_parser.add_argument("--loki-url", default=LOKI_URL)
+    loadtest_parser.add_argument("--stub", action="store_true", help="Run against a local stub backend instead")
+    loadtest_parser.add_argument("--stub-latency", type=float, default=0.01, help="Stub backend latency in seconds (default: 0.01)")
+    args = parser.parse_args(argv)
+
+    if args.command == "loadtest":
+        return loadtest(args.uid, args)
+
+    if args.command == "index":
+        return generate_index(args.stacks_dir, args.stacks)
+
+    if args.command == "check":
+        return check_dashboards(args.stacks_dir, args.stacks)
+
+    return generate_dashboard(args.stacks_dir, args.stacks)
+
 if __name__ == '__main__':
-    generate_dashboard()
+    sys.exit(main())